@@ -1,151 +1,642 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Request, request, jsonify, send_from_directory
 from flask_cors import CORS
+from werkzeug.exceptions import HTTPException
 import os
-from openai import OpenAI
 import tempfile
+import io
 import subprocess
 import re
+import atexit
+import logging
+import logging.handlers
+import queue
+import bisect
+import random
+import time
+import threading
+import uuid
+import urllib.parse
+import hashlib
+import functools
+from pathlib import Path
+import httpx
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Records are handed to a background listener thread, so formatting and
+# writing to stderr never block a request or job thread
+log_queue = queue.SimpleQueue()
+log_listener = logging.handlers.QueueListener(log_queue, logging.StreamHandler())
+log_listener.start()
+atexit.register(log_listener.stop)
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO'),
+                    handlers=[logging.handlers.QueueHandler(log_queue)])
+log = logging.getLogger(__name__)
+
+# Uploads and chunk files can be kept on a RAM-backed filesystem such as
+# /dev/shm by setting APP_TMPDIR; it falls back to the system temp dir if
+# that directory isn't writable.
+APP_TMPDIR = os.environ.get('APP_TMPDIR')
+if APP_TMPDIR and os.access(APP_TMPDIR, os.W_OK):
+    tempfile.tempdir = APP_TMPDIR
+
+UPLOAD_BUFFER_SIZE = 1024 * 1024
+
+class HashingFile:
+    """File wrapper that SHA-256 hashes bytes as they are written."""
+
+    def __init__(self, file):
+        self.file = file
+        self.sha256 = hashlib.sha256()
+
+    def write(self, data):
+        self.sha256.update(data)
+        return self.file.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+class LRUCache:
+    """Small thread-safe least-recently-used cache."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.items.get(key)
+            if value is not None:
+                self.items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+            if len(self.items) > self.maxsize:
+                self.items.popitem(last=False)
+
+class AnalysisError(ValueError):
+    """A video that can't be analyzed through no fault of the server."""
+
+class UploadRequest(Request):
+    """Request that spools uploaded files straight into named temp files.
+
+    ffmpeg can then read the upload in place instead of us copying it to a
+    second temp file first, and the content hash is computed while the file
+    is written. The file is deleted when Flask closes the request.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        suffix = os.path.splitext(filename or '')[1].lower() or '.mp4'
+        # A 1 MiB write buffer batches Werkzeug's small multipart chunks
+        return HashingFile(tempfile.NamedTemporaryFile(suffix=suffix, buffering=UPLOAD_BUFFER_SIZE))
 
 app = Flask(__name__, static_folder='static')
+app.request_class = UploadRequest
+# Optional upload size cap (unset means no limit). Werkzeug rejects larger
+# uploads from Content-Length before reading the body.
+MAX_UPLOAD_MB = int(os.environ.get('MAX_UPLOAD_MB', 0))
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_MB * 1024 * 1024 or None
 CORS(app)
 
-client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+# Guards the lazily created singletons below; lru_cache alone would let a
+# burst of first calls each build their own copy
+lazy_init_lock = threading.Lock()
+
+@functools.lru_cache(maxsize=None)
+def _create_client():
+    from openai import OpenAI
+    return OpenAI(
+        api_key=os.getenv('OPENAI_API_KEY'),
+        max_retries=0,
+        http_client=httpx.Client(
+            http2=True,
+            # At most one Whisper call per job thread plus one per chunk thread
+            # is in flight, so the pool can keep every one of them warm
+            limits=httpx.Limits(
+                max_keepalive_connections=JOB_WORKERS + TRANSCRIBE_WORKERS,
+                max_connections=JOB_WORKERS + TRANSCRIBE_WORKERS
+            ),
+            timeout=httpx.Timeout(120.0, connect=10.0)
+        )
+    )
+
+def get_client():
+    """Create the shared OpenAI client on first use.
+
+    Importing openai takes ~0.4 s, which would otherwise be paid by every
+    cold start, including ones that only serve /health. One pooled HTTP/2
+    connection set keeps TLS sessions warm across Whisper calls. Retries are
+    handled by _with_backoff so they aren't compounded with the SDK's own.
+    """
+    with lazy_init_lock:
+        return _create_client()
 
 FILLER_WORDS = ['um', 'uh', 'like', 'you know', 'so', 'actually', 'basically',
                 'literally', 'right', 'okay', 'well', 'i mean']
+# Longest alternatives first so multi-word phrases win over their parts
+FILLER_RE = re.compile(
+    r'\b(?:' + '|'.join(map(re.escape, sorted(FILLER_WORDS, key=len, reverse=True))) + r')\b'
+)
 
-def get_video_duration(video_path):
-    """Get video duration using ffprobe."""
-    cmd = [
-        'ffprobe', '-v', 'error',
-        '-show_entries', 'format=duration',
-        '-of', 'default=noprint_wrappers=1:nokey=1',
-        video_path
-    ]
-    result = subprocess.run(cmd, capture_output=True, text=True)
-    if result.returncode != 0:
-        raise Exception(f"Could not read video duration")
-    return float(result.stdout.strip())
-
-def extract_audio_ffmpeg(video_path, audio_path):
-    """Extract audio using ffmpeg."""
-    cmd = [
-        'ffmpeg', '-i', video_path,
-        '-vn', '-acodec', 'libmp3lame',
-        '-ar', '16000', '-ac', '1', '-b:a', '64k', '-y',
-        audio_path
-    ]
-    result = subprocess.run(cmd, capture_output=True, text=True)
+# Pace feedback by words per minute: below 120, 120-139, 140-160, 161-180
+# and above 180
+PACE_THRESHOLDS = [120, 140, 161, 181]
+PACE_MESSAGES = [
+    "Too slow. Try to increase your pace.",
+    "Good pace, slightly slow. Consider speaking a bit faster.",
+    "Excellent pace! You're speaking at an ideal rate.",
+    "Good pace, slightly fast. Consider slowing down slightly.",
+    "Too fast. Slow down for clarity.",
+]
+
+# Longer recordings are split into chunks of this many seconds and the
+# chunks are transcribed concurrently on a pool shared by all jobs
+CHUNK_SECONDS = 30
+TRANSCRIBE_WORKERS = 8
+transcribe_executor = ThreadPoolExecutor(max_workers=TRANSCRIBE_WORKERS)
+
+# /analyze runs the pipeline in the background and clients poll
+# /analyze/<job_id> (or register a webhook) for the result. Job state lives
+# in this process and finished jobs are dropped after JOB_TTL_SECONDS.
+# Jobs spend nearly all their time waiting on ffmpeg or the Whisper API,
+# so the pool can be much larger than the number of cores.
+JOB_TTL_SECONDS = 3600
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 16))
+job_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS)
+jobs = {}
+jobs_lock = threading.Lock()
+
+# Webhooks make this server POST to a client-supplied URL, so they are off
+# unless WEBHOOK_ALLOWED_HOSTS lists the hostnames they may target
+# (comma-separated). Deliveries run on their own small pool so a slow
+# endpoint can't hold up an analysis.
+WEBHOOK_ALLOWED_HOSTS = {
+    host.strip().lower() for host in os.environ.get('WEBHOOK_ALLOWED_HOSTS', '').split(',') if host.strip()
+}
+webhook_executor = ThreadPoolExecutor(max_workers=4)
+
+# Results of recent analyses keyed by the SHA-256 of the uploaded video, so
+# re-uploading the same clip skips ffmpeg and Whisper entirely
+result_cache = LRUCache(256)
+
+# Transcripts keyed by the SHA-256 of the extracted audio (made deterministic
+# in FFMPEG_EXTRACT_ARGS), so a clip whose upload bytes differ but whose
+# audio track is unchanged, e.g. re-tagged or with the video re-encoded,
+# skips Whisper
+transcript_cache = LRUCache(512)
+
+# How the audio sent to Whisper is encoded, picked with AUDIO_PRESET. 'opus'
+# keeps uploads small (~180 KB/min); 'flac' skips the lossy encode for hosts
+# with cheap bandwidth to OpenAI (~2 MB/min). WAV isn't offered because its
+# header sizes can't be filled in when ffmpeg writes to a pipe.
+AUDIO_PRESETS = {
+    'opus': {
+        'codec_args': ['-acodec', 'libopus', '-b:a', '24k', '-application', 'voip',
+                       '-compression_level', '5'],
+        'format': 'ogg',
+    },
+    'flac': {
+        'codec_args': ['-acodec', 'flac', '-compression_level', '0'],
+        'format': 'flac',
+    },
+}
+AUDIO_PRESET = AUDIO_PRESETS[os.environ.get('AUDIO_PRESET', 'opus')]
+AUDIO_FORMAT = AUDIO_PRESET['format']
+
+# ffmpeg arguments around the input; per-call paths are spliced in. The
+# probe limits stop ffmpeg scanning more of the container than it needs to
+# find the audio stream.
+FFMPEG_INPUT_ARGS = ['-analyzeduration', '2M', '-probesize', '2M']
+
+# Optional cap on video length (unset means no limit). ffmpeg stops decoding
+# just past the cap, so over-long uploads are rejected without encoding or
+# transcribing the rest.
+MAX_DURATION_SECONDS = float(os.environ.get('MAX_DURATION_SECONDS', 0))
+if MAX_DURATION_SECONDS:
+    FFMPEG_INPUT_ARGS += ['-t', str(MAX_DURATION_SECONDS + 1)]
+FFMPEG_EXTRACT_ARGS = ['-vn'] + AUDIO_PRESET['codec_args'] + [
+    '-af', 'silencedetect=n=-40dB:d=0.5',
+    '-ar', '16000', '-ac', '1', '-stats',
+    # Without bitexact the Ogg muxer picks a random stream serial on every
+    # run, and input tags would be copied into the output, so identical audio
+    # would never hash the same for transcript_cache
+    '-fflags', '+bitexact', '-map_metadata', '-1',
+    '-f', AUDIO_FORMAT, 'pipe:1'
+]
+FFMPEG_SPLIT_ARGS = [
+    '-f', 'segment', '-segment_time', str(CHUNK_SECONDS), '-c', 'copy'
+]
+
+WHISPER_PROMPT = "This is a public speaking practice video. Include all filler words like um, uh, like."
+
+# 'openai' sends audio to the Whisper API; 'local' runs faster-whisper
+# (CTranslate2, int8) in process, which must be installed separately
+TRANSCRIBE_BACKEND = os.environ.get('TRANSCRIBE_BACKEND', 'openai')
+LOCAL_WHISPER_MODEL = os.environ.get('LOCAL_WHISPER_MODEL', 'small.en')
+LOCAL_WHISPER_DEVICE = os.environ.get('LOCAL_WHISPER_DEVICE', 'cpu')
+
+DURATION_RE = re.compile(r'Duration: (\d+):(\d+):(\d+\.\d+)')
+PROGRESS_TIME_RE = re.compile(r'time=(\d+):(\d+):(\d+\.\d+)')
+SILENCE_DURATION_RE = re.compile(r'silence_duration: (\d+(?:\.\d+)?)')
+
+# Recordings with less detected speech than this many seconds, or than this
+# fraction of their length, are rejected before Whisper
+MIN_SPEECH_SECONDS = 1.0
+MIN_SPEECH_RATIO = 0.05
+
+# Only the tail of ffmpeg's stderr is kept (roughly 64 KB of lines)
+STDERR_TAIL_LINES = 65536 // 80
+
+# At most this many ffmpeg processes run at once; further jobs wait for a
+# slot instead of oversubscribing the CPU
+FFMPEG_PROCESSES = int(os.environ.get('FFMPEG_PROCESSES', os.cpu_count() or 1))
+ffmpeg_slots = threading.BoundedSemaphore(FFMPEG_PROCESSES)
+
+# ffmpeg runs longer than this are killed, so a stuck process can't keep
+# its slot forever
+FFMPEG_TIMEOUT_SECONDS = float(os.environ.get('FFMPEG_TIMEOUT_SECONDS', 600))
+
+def run_bounded(cmd, input=None, capture_stdout=False, on_line=None):
+    """Run a command, keeping only the last STDERR_TAIL_LINES of its stderr.
+
+    stderr is drained on a background thread so long ffmpeg runs can't
+    pile their progress output up in memory; on_line, if given, is called
+    from that thread with every line, for output that must not be lost to
+    the tail. Pass either input (bytes fed to stdin) or capture_stdout, not
+    both. Waits for one of the FFMPEG_PROCESSES slots first and kills the
+    command if it runs past FFMPEG_TIMEOUT_SECONDS. Returns a
+    CompletedProcess whose stderr is the decoded tail.
+    """
+    with ffmpeg_slots:
+        proc = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE if input is not None else subprocess.DEVNULL,
+            stdout=subprocess.PIPE if capture_stdout else subprocess.DEVNULL,
+            stderr=subprocess.PIPE
+        )
+        tail = deque(maxlen=STDERR_TAIL_LINES)
+
+        def drain():
+            # Universal newlines also split ffmpeg's \r-terminated progress lines
+            for line in io.TextIOWrapper(proc.stderr, encoding='utf-8', errors='replace'):
+                tail.append(line)
+                if on_line is not None:
+                    on_line(line)
+
+        drainer = threading.Thread(target=drain, daemon=True)
+        drainer.start()
+        timed_out = threading.Event()
+
+        def kill():
+            # Killing the process also unblocks the stdin write and stdout read
+            timed_out.set()
+            proc.kill()
+
+        killer = threading.Timer(FFMPEG_TIMEOUT_SECONDS, kill)
+        killer.daemon = True
+        killer.start()
+
+        stdout = None
+        if input is not None:
+            try:
+                proc.stdin.write(input)
+            except BrokenPipeError:
+                pass
+            proc.stdin.close()
+        if capture_stdout:
+            stdout = proc.stdout.read()
+            proc.stdout.close()
+        proc.wait()
+        killer.cancel()
+        drainer.join()
+        if timed_out.is_set():
+            raise Exception(f"ffmpeg did not finish within {FFMPEG_TIMEOUT_SECONDS:g} seconds")
+        return subprocess.CompletedProcess(cmd, proc.returncode, stdout, ''.join(tail))
+
+def _to_seconds(match):
+    hours, minutes, seconds = match.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+def extract_audio_ffmpeg(video_path):
+    """Extract audio using ffmpeg.
+
+    Returns an in-memory audio file (see AUDIO_PRESET), the video duration in seconds and
+    the total silence ffmpeg's silencedetect filter found, in seconds.
+    """
+    cmd = ['ffmpeg'] + FFMPEG_INPUT_ARGS + ['-i', video_path] + FFMPEG_EXTRACT_ARGS
+
+    # Long recordings print more stderr than the tail keeps, so the duration
+    # and silence are picked out line by line as ffmpeg writes them
+    found = {'duration': None, 'progress': None, 'silence': 0.0}
+
+    def on_line(line):
+        match = SILENCE_DURATION_RE.search(line)
+        if match:
+            found['silence'] += float(match.group(1))
+            return
+        if found['duration'] is None:
+            match = DURATION_RE.search(line)
+            if match:
+                found['duration'] = _to_seconds(match)
+                return
+        matches = list(PROGRESS_TIME_RE.finditer(line))
+        if matches:
+            found['progress'] = _to_seconds(matches[-1])
+
+    result = run_bounded(cmd, capture_stdout=True, on_line=on_line)
     if result.returncode != 0:
-        raise Exception(f"Could not extract audio from video")
+        raise Exception("Could not extract audio from video")
+
+    # The OpenAI SDK uses the file name to detect the audio format
+    audio_file = io.BytesIO(result.stdout)
+    audio_file.name = f'audio.{AUDIO_FORMAT}'
+
+    # ffmpeg prints the container duration while probing the input; browser
+    # recordings (webm) often report N/A there, so fall back to the last
+    # progress timestamp, which is how much audio was actually decoded.
+    duration_seconds = found['duration'] if found['duration'] is not None else found['progress']
+    if duration_seconds is None:
+        raise Exception("Could not read video duration")
+    return audio_file, duration_seconds, found['silence']
+
+def _with_backoff(fn, *, retries=5, base=1.0, cap=30.0):
+    """Call fn, retrying rate limits and transient API errors with jittered backoff."""
+    from openai import APIConnectionError, APIStatusError
+    for attempt in range(retries + 1):
+        try:
+            return fn()
+        except (APIConnectionError, APIStatusError) as e:
+            transient = isinstance(e, APIConnectionError) or e.status_code == 429 or e.status_code >= 500
+            if not transient or attempt == retries:
+                raise
+            time.sleep(min(cap, base * 2 ** attempt) + random.uniform(0, base))
 
-def transcribe_audio(audio_path):
-    """Transcribe audio using OpenAI Whisper."""
-    with open(audio_path, 'rb') as f:
-        transcript = client.audio.transcriptions.create(
+@functools.lru_cache(maxsize=None)
+def _load_local_model():
+    from faster_whisper import WhisperModel
+    compute_type = 'float16' if LOCAL_WHISPER_DEVICE == 'cuda' else 'int8'
+    return WhisperModel(LOCAL_WHISPER_MODEL, device=LOCAL_WHISPER_DEVICE, compute_type=compute_type)
+
+def get_local_model():
+    """Load the faster-whisper model once, on first use."""
+    with lazy_init_lock:
+        return _load_local_model()
+
+def transcribe_local(audio_file):
+    """Transcribe audio in process with faster-whisper."""
+    audio_file.seek(0)
+    segments, _ = get_local_model().transcribe(
+        audio_file,
+        language="en",
+        beam_size=1,
+        vad_filter=True,
+        condition_on_previous_text=False,
+        initial_prompt=WHISPER_PROMPT
+    )
+    return ' '.join(segment.text.strip() for segment in segments)
+
+def transcribe_audio(audio_file):
+    """Transcribe audio using Whisper."""
+    if TRANSCRIBE_BACKEND == 'local':
+        return transcribe_local(audio_file)
+
+    def create():
+        # Rewind so a retry uploads the whole file again
+        audio_file.seek(0)
+        return get_client().audio.transcriptions.create(
             model="whisper-1",
-            file=f,
+            file=audio_file,
             response_format="text",
             language="en",
             temperature=0,
-            prompt="This is a public speaking practice video. Include all filler words like um, uh, like."
+            prompt=WHISPER_PROMPT
         )
-    return transcript
+    return _with_backoff(create)
+
+def split_audio(audio_file, tmp_dir):
+    """Split extracted audio into CHUNK_SECONDS segments without re-encoding."""
+    segment_pattern = os.path.join(tmp_dir, f'seg_%03d.{AUDIO_FORMAT}')
+    cmd = ['ffmpeg', '-f', AUDIO_FORMAT, '-i', 'pipe:0'] + FFMPEG_SPLIT_ARGS + [segment_pattern]
+    result = run_bounded(cmd, input=audio_file.getvalue())
+    if result.returncode != 0:
+        raise Exception("Could not split audio into chunks")
+    return sorted(os.path.join(tmp_dir, name) for name in os.listdir(tmp_dir))
+
+def transcribe_segment(segment_path):
+    """Transcribe one audio segment file."""
+    with open(segment_path, 'rb') as f:
+        return transcribe_audio(f)
+
+def transcribe_chunked(audio_file, duration_seconds):
+    """Transcribe audio, splitting long recordings into concurrent chunks."""
+    # Chunking hides network latency; a local model has none to hide
+    if duration_seconds <= CHUNK_SECONDS or TRANSCRIBE_BACKEND == 'local':
+        return transcribe_audio(audio_file)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        segment_paths = split_audio(audio_file, tmp_dir)
+        # Whisper calls are network-bound, so threads overlap them fine
+        transcripts = list(transcribe_executor.map(transcribe_segment, segment_paths))
+
+    return ' '.join(t.strip() for t in transcripts if t.strip())
 
 def count_filler_words(text):
     """Count filler words in transcript."""
-    text_lower = text.lower()
-    words = re.findall(r'\b\w+\b', text_lower)
-    filler_counts = {}
-    total_count = 0
-    
-    for filler in FILLER_WORDS:
-        if ' ' in filler:
-            count = text_lower.count(filler)
-        else:
-            count = words.count(filler)
-        if count > 0:
-            filler_counts[filler] = count
-            total_count += count
-    
-    return total_count, filler_counts
+    # One scan for every filler; only the hits are materialized
+    filler_counts = Counter(FILLER_RE.findall(text.lower()))
+    return sum(filler_counts.values()), dict(filler_counts)
 
 def assess_pace(wpm):
     """Assess speaking pace."""
-    if 140 <= wpm <= 160:
-        return "Excellent pace! You're speaking at an ideal rate."
-    elif 120 <= wpm < 140:
-        return "Good pace, slightly slow. Consider speaking a bit faster."
-    elif 160 < wpm <= 180:
-        return "Good pace, slightly fast. Consider slowing down slightly."
-    elif wpm < 120:
-        return "Too slow. Try to increase your pace."
-    else:
-        return "Too fast. Slow down for clarity."
-
-# Serve the frontend HTML
-@app.route('/')
+    return PACE_MESSAGES[bisect.bisect_right(PACE_THRESHOLDS, wpm)]
+
+def analyze_transcript(transcript, duration_seconds):
+    """Compute the speaking metrics for a transcript."""
+    word_count = len(transcript.split())
+    words_per_min = int((word_count / duration_seconds) * 60) if duration_seconds > 0 else 0
+    filler_count, filler_breakdown = count_filler_words(transcript)
+    filler_rate_per_min = round(filler_count / (duration_seconds / 60), 2) if duration_seconds > 0 else 0
+    pace_assessment = assess_pace(words_per_min)
+
+    return {
+        'transcript': transcript,
+        'duration': round(duration_seconds, 2),
+        'word_count': word_count,
+        'words_per_min': words_per_min,
+        'filler_count': filler_count,
+        'filler_rate_per_min': filler_rate_per_min,
+        'filler_words': filler_breakdown,
+        'assessment': {'pace': pace_assessment}
+    }
+
+# Serve the frontend HTML. In production the reverse proxy serves it (see
+# nginx.conf) and SERVE_STATIC=0 leaves only the API routes here.
 def index():
     return send_from_directory('static', 'index.html')
 
+if os.environ.get('SERVE_STATIC', '1') != '0':
+    app.add_url_rule('/', 'index', index)
+
+def run_analysis(video_path):
+    """Run the full pipeline on a video file and return the results."""
+    # Extract audio (ffmpeg reports the duration while it runs)
+    audio_file, duration_seconds, silence_seconds = extract_audio_ffmpeg(video_path)
+    log.debug("Extracted %.1f s of audio (%.1f s silent, %d bytes)",
+              duration_seconds, silence_seconds, len(audio_file.getbuffer()))
+    if MAX_DURATION_SECONDS and duration_seconds > MAX_DURATION_SECONDS:
+        raise AnalysisError(f"Video is too long (limit is {MAX_DURATION_SECONDS:g} seconds)")
+    speech_seconds = duration_seconds - silence_seconds
+    if speech_seconds < max(MIN_SPEECH_SECONDS, MIN_SPEECH_RATIO * duration_seconds):
+        raise AnalysisError("No speech detected in the video. Check that your microphone was recording.")
+
+    # Transcribe audio, unless this exact audio was transcribed recently
+    audio_digest = hashlib.sha256(audio_file.getbuffer()).hexdigest()
+    transcript = transcript_cache.get(audio_digest)
+    if transcript is None:
+        transcript = transcribe_chunked(audio_file, duration_seconds)
+        transcript_cache.put(audio_digest, transcript)
+
+    return analyze_transcript(transcript, duration_seconds)
+
+def job_payload(job_id, job):
+    """Build the JSON body describing a job's current state."""
+    if job['status'] == 'done':
+        return {'job_id': job_id, 'status': 'done', **job['result']}
+    if job['status'] == 'error':
+        return {'job_id': job_id, 'status': 'error', 'error': job['error']}
+    return {'job_id': job_id, 'status': job['status']}
+
+def send_webhook(url, payload):
+    """POST a finished job to its registered webhook."""
+    try:
+        httpx.post(url, json=payload, timeout=10.0)
+    except Exception as e:
+        log.warning("Webhook to %s failed: %s", url, e)
+
+def run_job(job_id, video_path, digest):
+    """Run the pipeline for a queued job and record the outcome."""
+    with jobs_lock:
+        jobs[job_id]['status'] = 'running'
+    try:
+        result = run_analysis(video_path)
+        result_cache.put(digest, result)
+        update = {'status': 'done', 'result': result}
+    except AnalysisError as e:
+        # The upload's fault, reported to the client as a 400
+        log.info("Job %s rejected: %s", job_id, e)
+        update = {'status': 'error', 'error': str(e), 'http_status': 400}
+    except Exception as e:
+        log.exception("Job %s failed", job_id)
+        update = {'status': 'error', 'error': str(e), 'http_status': 500}
+    finally:
+        # A cleanup failure must not leave the job stuck as 'running'
+        try:
+            Path(video_path).unlink(missing_ok=True)
+        except OSError as e:
+            log.warning("Could not remove %s: %s", video_path, e)
+
+    with jobs_lock:
+        job = jobs[job_id]
+        job.update(update, finished_at=time.monotonic())
+        webhook_url = job.get('webhook_url')
+        payload = job_payload(job_id, job)
+    if webhook_url:
+        webhook_executor.submit(send_webhook, webhook_url, payload)
+
+def prune_jobs():
+    """Forget finished jobs older than JOB_TTL_SECONDS."""
+    cutoff = time.monotonic() - JOB_TTL_SECONDS
+    with jobs_lock:
+        for job_id in [k for k, job in jobs.items() if job.get('finished_at', cutoff) < cutoff]:
+            del jobs[job_id]
+
+@app.errorhandler(413)
+def upload_too_large(e):
+    return jsonify({'error': f'Video is too large (limit is {MAX_UPLOAD_MB} MB)'}), 413
+
 @app.route('/analyze', methods=['POST'])
 def analyze_video():
-    video_path = None
-    audio_path = None
-    
     try:
         if 'video' not in request.files:
             return jsonify({'error': 'No video file provided'}), 400
 
+        # The upload is already on disk (see UploadRequest). Hard-link it so
+        # the job keeps the file after the request closes, without a copy.
         video_file = request.files['video']
-        file_ext = os.path.splitext(video_file.filename)[1].lower() or '.mp4'
-
-        # Save video temporarily
-        with tempfile.NamedTemporaryFile(delete=False, suffix=file_ext) as tmp_video:
-            video_file.save(tmp_video.name)
-            video_path = tmp_video.name
-
-        # Get video duration
-        duration_seconds = get_video_duration(video_path)
-
-        # Extract audio
-        audio_path = video_path.replace(file_ext, '.mp3')
-        extract_audio_ffmpeg(video_path, audio_path)
-
-        # Transcribe audio
-        transcript = transcribe_audio(audio_path)
-
-        # Analyze transcript
-        word_count = len(transcript.split())
-        words_per_min = int((word_count / duration_seconds) * 60) if duration_seconds > 0 else 0
-        filler_count, filler_breakdown = count_filler_words(transcript)
-        filler_rate_per_min = round(filler_count / (duration_seconds / 60), 2) if duration_seconds > 0 else 0
-        pace_assessment = assess_pace(words_per_min)
-
-        return jsonify({
-            'transcript': transcript,
-            'duration': round(duration_seconds, 2),
-            'word_count': word_count,
-            'words_per_min': words_per_min,
-            'filler_count': filler_count,
-            'filler_rate_per_min': filler_rate_per_min,
-            'filler_words': filler_breakdown,
-            'assessment': {'pace': pace_assessment}
-        })
+        digest = video_file.stream.sha256.hexdigest()
+        job_id = uuid.uuid4().hex
+        prune_jobs()
 
+        # A cached result is recorded as an already finished job, so clients
+        # get the same payload (and can still register a webhook) either way
+        cached = result_cache.get(digest)
+        if cached is not None:
+            with jobs_lock:
+                jobs[job_id] = {'status': 'done', 'result': cached, 'finished_at': time.monotonic()}
+                payload = job_payload(job_id, jobs[job_id])
+            return jsonify(payload)
+
+        video_file.stream.flush()
+        video_path = os.path.join(
+            os.path.dirname(video_file.stream.name),
+            job_id + os.path.splitext(video_file.stream.name)[1]
+        )
+        os.link(video_file.stream.name, video_path)
+
+        with jobs_lock:
+            jobs[job_id] = {'status': 'pending'}
+        log.debug("Queueing job %s (%.2f MB request)", job_id, (request.content_length or 0) / (1024 * 1024))
+        job_executor.submit(run_job, job_id, video_path, digest)
+
+        return jsonify({'job_id': job_id, 'status': 'pending'}), 202
+
+    except HTTPException:
+        # e.g. the upload size limit; handled by the registered error handlers
+        raise
     except Exception as e:
-        print(f"Error: {str(e)}")
+        log.exception("Could not queue analysis")
         return jsonify({'error': str(e)}), 500
 
-    finally:
-        # Cleanup temp files
-        try:
-            if video_path and os.path.exists(video_path):
-                os.unlink(video_path)
-            if audio_path and os.path.exists(audio_path):
-                os.unlink(audio_path)
-        except:
-            pass
+@app.route('/analyze/<job_id>', methods=['GET'])
+def analyze_status(job_id):
+    with jobs_lock:
+        job = jobs.get(job_id)
+        if job is None:
+            return jsonify({'error': 'Unknown job'}), 404
+        payload = job_payload(job_id, job)
+
+    if payload['status'] == 'done':
+        return jsonify(payload)
+    if payload['status'] == 'error':
+        return jsonify(payload), job['http_status']
+    return jsonify(payload), 202
+
+@app.route('/analyze/<job_id>/webhook', methods=['POST'])
+def analyze_webhook(job_id):
+    if not WEBHOOK_ALLOWED_HOSTS:
+        return jsonify({'error': 'Webhooks are not enabled on this server'}), 403
+    url = (request.get_json(silent=True) or {}).get('url', '')
+    if not url.startswith(('http://', 'https://')):
+        return jsonify({'error': 'A http(s) webhook url is required'}), 400
+    if (urllib.parse.urlsplit(url).hostname or '') not in WEBHOOK_ALLOWED_HOSTS:
+        return jsonify({'error': 'Webhook host is not allowed'}), 403
+
+    with jobs_lock:
+        job = jobs.get(job_id)
+        if job is None:
+            return jsonify({'error': 'Unknown job'}), 404
+        job['webhook_url'] = url
+        finished = job['status'] in ('done', 'error')
+        payload = job_payload(job_id, job)
+
+    # Jobs that already finished are delivered right away
+    if finished:
+        webhook_executor.submit(send_webhook, url, payload)
+    return jsonify({'job_id': job_id, 'webhook_url': url})
 
 @app.route('/health', methods=['GET'])
 def health():
@@ -0,0 +1,19 @@
+# Production server settings, picked up automatically by:
+#   gunicorn app:app
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+
+# Analysis jobs are tracked in process memory, so a single worker process
+# serves every request. One process also means the local faster-whisper
+# model (TRANSCRIBE_BACKEND=local) is loaded only once.
+workers = 1
+# Request threads only spool uploads to disk, queue jobs and answer status
+# polls; the ffmpeg and Whisper work runs on the app's job pool, sized by
+# JOB_WORKERS. Raise this for many concurrent slow uploads, not for more
+# analysis throughput.
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+
+# Uploads of large videos can take a while to arrive
+timeout = 300